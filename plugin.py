@@ -4,40 +4,102 @@ OpenClaw Wheel Strategy Plugin
 """
 
 import asyncio
+import atexit
+import functools
 import json
 import logging
 import math
 import os
+import pickle
 import random
+import re
+import threading
 import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from types import MappingProxyType
 from typing import Optional
 
+import numpy as np
 import yfinance as yf
 import pandas as pd
 from ib_async import IB, Stock, Option, Contract, util
 
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+try:
+    from yfinance.exceptions import YFDataException
+except ImportError:
+    # 舊版 yfinance 沒有這個例外，也不會拒絕自訂 session
+    YFDataException = ()
+
 logger = logging.getLogger('openclaw.wheel')
 
 # Config path
 CONFIG_PATH = Path(__file__).parent / 'config.json'
 
+# 沒有 config.json 時的預設值
+_DEFAULT_CONFIG = {'host': '127.0.0.1', 'port': 7497, 'client_id': 1, 'readonly': True}
+
+# yfinance 並行抓取的最大 thread 數
+_MAX_WORKERS = 16
+
+# yf.download 每批最多幾檔
+_DOWNLOAD_BATCH = 20
+
+# yfinance 期權數值欄位（greeks 欄位 yfinance 通常沒有，缺的補 0）
+_YF_OPTION_FIELDS = ['bid', 'ask', 'lastPrice', 'impliedVolatility',
+                     'delta', 'theta', 'gamma', 'vega']
+
+# IB 沒回傳 greeks 時用的預設值（不可變，可共用）
+_ZERO_GREEKS = namedtuple('Greeks', 'delta gamma theta vega')(0.0, 0.0, 0.0, 0.0)
+
+# IB accountSummary tag -> 輸出欄位
+_ACCT_MAP = {
+    'NetLiquidation': 'net_liquidation',
+    'TotalCashValue': 'cash',
+    'ExcessLiquidity': 'excess_liquidity',
+    'FullInitMarginReq': 'margin',
+}
+
+# 快取 TTL（秒）
+_PRICE_TTL = 15
+_CHAIN_TTL = 60
+
+# 快取: key -> (過期時間, 值)；設定 OPENCLAW_REDIS_URL 時再加一層 Redis
+_CACHE: dict = {}
+_redis_client = None
+
+# yfinance 共用的 HTTP 快取 session（沒裝 requests_cache 或 yfinance 拒絕時為 None）
+_yf_http_session = requests_cache.CachedSession(
+    'yf_cache', backend='memory', expire_after=_PRICE_TTL, stale_if_error=True
+) if requests_cache else None
+
 # Singleton connection - 重複使用同一個 client
 _ib_instance = None
 _ib_config = None
 
 
+@functools.lru_cache(maxsize=1)
+def _load_config_cached(path: str) -> MappingProxyType:
+    """載入配置（每個 process 只解析一次，回傳唯讀 mapping）"""
+    config_file = Path(path)
+    if config_file.exists():
+        with open(config_file) as f:
+            return MappingProxyType(json.load(f))
+    return MappingProxyType(dict(_DEFAULT_CONFIG))
+
+
 def _get_shared_ib(config_path: str = None) -> IB:
     """取得共享的 IB 連線"""
     global _ib_instance, _ib_config
     
-    config_file = Path(config_path) if config_path else CONFIG_PATH
-    if config_file.exists():
-        with open(config_file) as f:
-            config = json.load(f)
-    else:
-        config = {'host': '127.0.0.1', 'port': 7497, 'client_id': 1, 'readonly': True}
+    config = _load_config_cached(str(Path(config_path) if config_path else CONFIG_PATH))
     
     # 如果 config 沒變，且連線還在，就重用
     if _ib_instance and _ib_instance.isConnected():
@@ -65,6 +127,238 @@ def _get_shared_ib(config_path: str = None) -> IB:
     return _ib_instance
 
 
+def _get_redis():
+    """取得 Redis client（沒設定 OPENCLAW_REDIS_URL、沒裝 redis 或連不上則為 None）"""
+    global _redis_client
+    
+    if _redis_client is None:
+        _redis_client = False
+        url = os.environ.get('OPENCLAW_REDIS_URL')
+        if url:
+            try:
+                import redis
+                # 短 timeout - Redis 只是加速用，不能拖慢每次查詢
+                _redis_client = redis.Redis.from_url(
+                    url, socket_connect_timeout=0.2, socket_timeout=0.2)
+            except Exception as e:
+                logger.warning(f"Redis 無法使用: {e}")
+    
+    return _redis_client or None
+
+
+def _redis_failed(e: Exception, action: str):
+    """Redis 操作失敗 - 連線問題就停用 Redis，之後只用 process 內快取"""
+    global _redis_client
+    import redis
+    
+    if isinstance(e, (redis.ConnectionError, redis.TimeoutError)):
+        logger.warning(f"Redis 連線失敗，停用 Redis 快取: {e}")
+        _redis_client = False
+    else:
+        logger.warning(f"Redis {action}失敗: {e}")
+
+
+def _cache_copy(value):
+    """dict 回傳淺複製，避免呼叫端改到快取內容"""
+    return dict(value) if isinstance(value, dict) else value
+
+
+def _cache_get(key: str):
+    """讀取快取（未命中或過期回傳 None）"""
+    entry = _CACHE.get(key)
+    if entry:
+        if entry[0] > time.monotonic():
+            return _cache_copy(entry[1])
+        _CACHE.pop(key, None)
+    
+    client = _get_redis()
+    if client:
+        try:
+            raw = client.get(f'openclaw:wheel:{key}')
+            if raw is not None:
+                # Redis 存的是 (過期的 wall-clock 時間, 值)，命中後寫回 process 內快取
+                expires_at, value = pickle.loads(raw)
+                _CACHE[key] = (time.monotonic() + expires_at - time.time(), value)
+                return _cache_copy(value)
+        except Exception as e:
+            _redis_failed(e, '讀取')
+    
+    return None
+
+
+def _cache_set(key: str, ttl: float, value):
+    """寫入快取"""
+    value = _cache_copy(value)
+    _CACHE[key] = (time.monotonic() + ttl, value)
+    
+    client = _get_redis()
+    if client:
+        try:
+            client.setex(f'openclaw:wheel:{key}', int(ttl),
+                         pickle.dumps((time.time() + ttl, value)))
+        except Exception as e:
+            _redis_failed(e, '寫入')
+
+
+def _cached(key: str, ttl: float, fn):
+    """有快取就用快取，否則呼叫 fn 並存起來（None 和錯誤結果不快取）"""
+    value = _cache_get(key)
+    if value is None:
+        value = fn()
+        if value is not None and not (isinstance(value, dict) and 'error' in value):
+            _cache_set(key, ttl, value)
+    return value
+
+
+def _yf_call(fn):
+    """呼叫 fn(session)；yfinance 拒絕 HTTP 快取 session 時改用預設 session 並停用快取"""
+    global _yf_http_session
+    
+    session = _yf_http_session
+    if session is not None:
+        try:
+            return fn(session)
+        except YFDataException as e:
+            # 新版 yfinance 不接受 requests_cache session
+            logger.info(f"yfinance 不支援 HTTP 快取 session，使用預設 session: {e}")
+            _yf_http_session = None
+    
+    return fn(None)
+
+
+def _yf_ticker(symbol: str) -> yf.Ticker:
+    """建立 yfinance Ticker（共用 HTTP 快取 session）"""
+    return _yf_call(lambda session: yf.Ticker(symbol, session=session))
+
+
+def _download_prices(symbols: list) -> dict:
+    """用 yf.download 批次取得最新價格（一批一個 request）"""
+    prices = {}
+    for i in range(0, len(symbols), _DOWNLOAD_BATCH):
+        batch = symbols[i:i + _DOWNLOAD_BATCH]
+        try:
+            df = _yf_call(lambda session: yf.download(
+                ' '.join(batch), period='1d', interval='1m', progress=False,
+                threads=True, group_by='ticker', session=session))
+        except Exception as e:
+            logger.error(f"yfinance 批次取得股價失敗: {e}")
+            continue
+        
+        if df is None or df.empty:
+            continue
+        
+        for symbol in batch:
+            try:
+                # 舊版 yfinance 單一代碼時不是 MultiIndex
+                if isinstance(df.columns, pd.MultiIndex):
+                    close = df[symbol]['Close'].dropna()
+                else:
+                    close = df['Close'].dropna()
+            except KeyError:
+                continue
+            if not close.empty:
+                prices[symbol] = float(close.iloc[-1])
+    
+    return prices
+
+
+def _quote_price(ticker: yf.Ticker) -> Optional[float]:
+    """取得現價 - 先用輕量的 fast_info，最後才用完整的 .info"""
+    try:
+        price = ticker.fast_info.get('last_price')
+        if price and not math.isnan(price):
+            return float(price)
+    except Exception as e:
+        logger.warning(f"yfinance fast_info 失敗: {e}")
+    
+    try:
+        info = ticker.info
+        price = info.get('currentPrice') or info.get('regularMarketPrice')
+        if price:
+            return float(price)
+    except Exception as e:
+        logger.error(f"yfinance 取得 {ticker.ticker} 股價失敗: {e}")
+    
+    return None
+
+
+def _fetch_quote_price(symbol: str) -> Optional[float]:
+    """用 yfinance 取得單一代碼現價"""
+    return _quote_price(_yf_ticker(symbol))
+
+
+def _yf_date(expiration: str) -> str:
+    """IB 格式的到期日 (YYYYMMDD) 轉成 yfinance 格式 (YYYY-MM-DD)"""
+    if len(expiration) == 8 and expiration.isdigit():
+        return f'{expiration[:4]}-{expiration[4:6]}-{expiration[6:]}'
+    return expiration
+
+
+def _mid_prices(bid, ask, last) -> np.ndarray:
+    """計算 mid 價格（如果 bid/ask 為 0，用 last）- 純量或整欄都適用"""
+    return np.select(
+        [(bid == 0) & (ask == 0) & (last > 0), (bid > 0) & (ask > 0), bid > 0, ask > 0],
+        [last, (bid + ask) / 2, bid, ask],
+        default=0.0)
+
+
+def _pick_option(options: pd.DataFrame, symbol: str, stock_price: float,
+                 otm_pct: float, option_type: str) -> dict:
+    """從 yfinance 期權表（calls 或 puts）挑出最接近 OTM 目標的合約"""
+    if options is None or options.empty:
+        return {'error': '無期權數據'}
+    
+    # 計算目標 strike
+    if option_type.upper() == 'PUT':
+        target_strike = stock_price * (1 - otm_pct / 100)
+    else:
+        target_strike = stock_price * (1 + otm_pct / 100)
+    
+    # 四捨五入到最近的整數
+    target_strike = round(target_strike)
+    
+    # 找最近的 strike（O(N)，不需要排序）
+    strikes = options['strike'].to_numpy(dtype=np.float64)
+    idx = int(np.abs(strikes - target_strike).argmin())
+    
+    # 整欄清理 NaN / 負值，不用逐欄位檢查
+    values = options.reindex(columns=_YF_OPTION_FIELDS).astype(np.float64).fillna(0.0)
+    values[['bid', 'ask']] = values[['bid', 'ask']].clip(lower=0)
+    bid, ask, last, iv, delta, theta, gamma, vega = (
+        float(values.iat[idx, i]) for i in range(len(_YF_OPTION_FIELDS)))
+    
+    mid = _mid_prices(bid, ask, last).item()
+    
+    # 取得到期日 - OCC 格式: 代碼 + YYMMDD + C/P + 8 位 strike
+    expirations = '20' + options['contractSymbol'].str[-15:-9]
+    expiration = expirations.iat[idx]
+    
+    return {
+        'symbol': symbol,
+        'stock_price': stock_price,
+        'expiration': expiration,
+        'strike': float(strikes[idx]),
+        'bid': bid,
+        'ask': ask,
+        'last': last,
+        'iv': iv,
+        'delta': delta,
+        'theta': theta,
+        'gamma': gamma,
+        'vega': vega,
+        'premium': mid * 100,  # 每合約 100 股
+    }
+
+
+def _parallel_map(fn, items: list) -> list:
+    """用 thread pool 並行執行 fn（yfinance 是 network-bound）"""
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    # yfinance 內部的 YfData 是 singleton，所有 Ticker 共用同一個 HTTP session
+    with ThreadPoolExecutor(max_workers=min(len(items), _MAX_WORKERS)) as ex:
+        return list(ex.map(fn, items))
+
+
 class IBWheel:
     """Interactive Brokers Wheel Strategy 助手"""
     
@@ -72,6 +366,7 @@ class IBWheel:
         self.config_path = Path(config_path) if config_path else CONFIG_PATH
         self.config = self._load_config()
         self._reuse = reuse_connection
+        self._contract_cache: dict = {}  # (symbol, secType, currency) -> 已 qualify 的合約
         
         if reuse_connection:
             # 使用共享連線
@@ -82,17 +377,9 @@ class IBWheel:
             self.ib = IB()
             self._connected = False
         
-    def _load_config(self) -> dict:
+    def _load_config(self) -> MappingProxyType:
         """載入配置"""
-        if self.config_path.exists():
-            with open(self.config_path) as f:
-                return json.load(f)
-        return {
-            'host': '127.0.0.1',
-            'port': 7497,
-            'client_id': 1,
-            'readonly': True
-        }
+        return _load_config_cached(str(self.config_path))
     
     def _ensure_connection(self) -> bool:
         """確保連接"""
@@ -108,7 +395,8 @@ class IBWheel:
             
             try:
                 logging.getLogger('ib_async').setLevel(logging.ERROR)
-                client_id = self.config.get('client_id', 1) + int(time.time() % 1000)
+                # 每個 process 固定一個 client id，避免和共享連線衝突
+                client_id = self.config.get('client_id', 1) + 1 + os.getpid() % 1000
                 self.ib.connect(
                     self.config['host'],
                     self.config['port'],
@@ -121,6 +409,17 @@ class IBWheel:
                 logger.error(f"連接失敗: {e}")
                 return False
     
+    def _qualified_stock(self, symbol: str) -> Stock:
+        """取得已 qualify 的股票合約（有快取）"""
+        key = (symbol, 'STK', 'USD')
+        if key not in self._contract_cache:
+            stock = Stock(symbol, 'SMART', 'USD')
+            self.ib.qualifyContracts(stock)
+            if not stock.conId:
+                return stock
+            self._contract_cache[key] = stock
+        return self._contract_cache[key]
+    
     def disconnect(self):
         """斷開連接（共享模式下不真的斷開）"""
         if not self._reuse and self._connected:
@@ -129,142 +428,146 @@ class IBWheel:
     
     def get_stock_price(self, symbol: str) -> Optional[float]:
         """取得股價 - 先嘗試 IB，失敗則用 yfinance"""
+        return self.get_stock_prices([symbol]).get(symbol)
+    
+    def get_stock_prices(self, symbols: list) -> dict:
+        """批次取得股價 - 先嘗試 IB，剩下的用 yfinance 批次查詢"""
+        prices = {}
+        for symbol in symbols:
+            price = _cache_get(f'price:{symbol}')
+            if price is not None:
+                prices[symbol] = price
+        cached = set(prices)
         
-        # 嘗試 IB
-        if self._ensure_connection():
+        # 嘗試 IB（並行）
+        if len(prices) < len(symbols) and self._ensure_connection():
+            pending = [s for s in symbols if s not in prices]
             try:
-                contract = Stock(symbol, 'SMART', 'USD')
-                self.ib.qualifyContracts(contract)
-                
-                # 嘗試即時數據
-                self.ib.reqMarketDataType(1)
-                ticker = self.ib.reqMktData(contract)
-                
-                for _ in range(10):
-                    self.ib.sleep(0.1)
-                    if ticker.marketPrice() and not math.isnan(ticker.marketPrice()):
-                        price = ticker.marketPrice()
-                        self.ib.cancelMktData(contract)
-                        return float(price)
-                
-                # 嘗試 frozen 數據
-                self.ib.reqMarketDataType(2)
-                ticker = self.ib.reqMktData(contract)
-                for _ in range(10):
-                    self.ib.sleep(0.1)
-                    if ticker.close and not math.isnan(ticker.close):
-                        price = ticker.close
-                        self.ib.cancelMktData(contract)
-                        return float(price)
-                
-                self.ib.cancelMktData(contract)
+                prices.update(self.ib.run(self._a_get_stock_prices(pending)))
             except Exception as e:
                 logger.warning(f"IB 取得股價失敗: {e}")
         
-        # Fallback: yfinance
-        try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
-            price = info.get('currentPrice') or info.get('regularMarketPrice')
+        # Fallback: yfinance（一次下載整批）
+        missing = [s for s in symbols if s not in prices]
+        if missing:
+            prices.update(_download_prices(missing))
+        
+        # 還是拿不到的再逐一查詢（並行）
+        missing = [s for s in symbols if s not in prices]
+        for symbol, price in zip(missing, _parallel_map(_fetch_quote_price, missing)):
             if price:
-                return float(price)
-        except Exception as e:
-            logger.error(f"yfinance 取得股價失敗: {e}")
+                prices[symbol] = price
+        
+        for symbol, price in prices.items():
+            if symbol not in cached:
+                _cache_set(f'price:{symbol}', _PRICE_TTL, price)
+        
+        return prices
+    
+    async def _a_get_stock_prices(self, symbols: list) -> dict:
+        """用 IB 並行取得股價 - 先即時數據，拿不到再用 frozen 數據"""
+        contracts = [self._contract_cache.get((s, 'STK', 'USD')) or Stock(s, 'SMART', 'USD')
+                     for s in symbols]
+        
+        # 只 qualify 還沒快取的合約
+        unqualified = [c for c in contracts if not c.conId]
+        if unqualified:
+            await self.ib.qualifyContractsAsync(*unqualified)
+            for c in unqualified:
+                if c.conId:
+                    self._contract_cache[(c.symbol, 'STK', 'USD')] = c
+        contracts = [c for c in contracts if c.conId]
         
-        return None
+        prices = {}
+        for market_data_type in (1, 2):
+            pending = [c for c in contracts if c.symbol not in prices]
+            if not pending:
+                break
+            
+            # market data type 是整個連線共用的，所以同一批一起切換
+            self.ib.reqMarketDataType(market_data_type)
+            results = await asyncio.gather(*(
+                self._a_get_stock_price(c, frozen=market_data_type == 2) for c in pending))
+            prices.update({c.symbol: p for c, p in zip(pending, results) if p})
+        
+        return prices
+    
+    async def _a_get_stock_price(self, contract: Contract, frozen: bool = False,
+                                 timeout: float = 1.0) -> Optional[float]:
+        """等待單一股票報價，收到有效 tick 就立刻回傳"""
+        ticker = self.ib.reqMktData(contract)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                price = ticker.close if frozen else ticker.marketPrice()
+                if price and not math.isnan(price):
+                    return float(price)
+                
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                await asyncio.wait_for(ticker.updateEvent, remaining)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.ib.cancelMktData(contract)
     
     def _get_option_chain_yf(self, symbol: str, otm_pct: float = 10, 
-                            option_type: str = 'PUT') -> dict:
-        """用 yfinance 取得期權鏈"""
+                            option_type: str = 'PUT',
+                            stock_price: Optional[float] = None,
+                            expiration: str = None) -> dict:
+        """用 yfinance 取得單邊期權（有快取）"""
+        side = 'PUT' if option_type.upper() == 'PUT' else 'CALL'
+        return self._get_option_sides_yf(symbol, otm_pct, (side,), stock_price, expiration)[side]
+    
+    def _get_option_sides_yf(self, symbol: str, otm_pct: float, sides: tuple,
+                             stock_price: Optional[float] = None,
+                             expiration: str = None) -> dict:
+        """用 yfinance 取得指定各邊的期權（每邊各自快取，有缺才下載一次）"""
+        suffix = f':{expiration}' if expiration else ''
+        fetched = {}
+        
+        def fetch(side):
+            if not fetched:
+                fetched.update(self._fetch_option_chain_yf(symbol, otm_pct, sides,
+                                                           stock_price, expiration))
+            return fetched[side]
+        
+        return {side: _cached(f'chain:{symbol}:{otm_pct}:{side}{suffix}', _CHAIN_TTL,
+                              lambda side=side: fetch(side))
+                for side in sides}
+    
+    def _fetch_option_chain_yf(self, symbol: str, otm_pct: float, sides: tuple,
+                               stock_price: Optional[float] = None,
+                               expiration: str = None) -> dict:
+        """用 yfinance 取得期權鏈，回傳 {side: 結果}（已知股價時不再查詢）"""
         try:
-            ticker = yf.Ticker(symbol)
-            stock_price = ticker.info.get('currentPrice') or ticker.info.get('regularMarketPrice')
-            
+            ticker = _yf_ticker(symbol)
             if not stock_price:
-                return {'error': '無法取得股價'}
-            
-            # 計算目標 strike
-            if option_type.upper() == 'PUT':
-                target_strike = stock_price * (1 - otm_pct / 100)
-            else:
-                target_strike = stock_price * (1 + otm_pct / 100)
-            
-            # 四捨五入到最近的整數
-            target_strike = round(target_strike)
-            
-            # 取得期權鏈
-            opt_chain = ticker.option_chain()
-            
-            if option_type.upper() == 'PUT':
-                options = opt_chain.puts
-            else:
-                options = opt_chain.calls
+                stock_price = _quote_price(ticker)
             
-            if options is None or options.empty:
-                return {'error': '無期權數據'}
-            
-            # 轉換為 list 並找最近的 strike
-            options['strike'] = options['strike'].astype(float)
-            options = options.sort_values('strike')
-            
-            # 找最近的
-            closest = options.iloc[(options['strike'] - target_strike).abs().argsort()[:1]]
-            
-            if closest.empty:
-                return {'error': '找不到合適的 strike'}
-            
-            row = closest.iloc[0]
-            
-            # 取得價格
-            bid = float(row['bid']) if pd.notna(row.get('bid')) and row['bid'] > 0 else 0
-            ask = float(row['ask']) if pd.notna(row.get('ask')) and row['ask'] > 0 else 0
-            last = float(row['lastPrice']) if pd.notna(row.get('lastPrice')) else 0
-            
-            # 如果 bid/ask 為 0，用 last
-            if bid == 0 and ask == 0 and last > 0:
-                mid = last
-            elif bid > 0 and ask > 0:
-                mid = (bid + ask) / 2
-            elif bid > 0:
-                mid = bid
-            elif ask > 0:
-                mid = ask
-            else:
-                mid = 0
+            if not stock_price:
+                return {side: {'error': '無法取得股價'} for side in sides}
             
-            # 取得到期日
-            exp = row.get('contractSymbol', '')
-            if exp and len(exp) >= 8:
-                expiration = exp[-8:]  # 最後 8 個字元是日期
-            else:
-                expiration = ''
-            
-            return {
-                'symbol': symbol,
-                'stock_price': stock_price,
-                'expiration': expiration,
-                'strike': float(row['strike']),
-                'bid': bid,
-                'ask': ask,
-                'last': last,
-                'iv': float(row['impliedVolatility']) if pd.notna(row.get('impliedVolatility')) else 0,
-                'delta': float(row['delta']) if pd.notna(row.get('delta')) else 0,
-                'theta': float(row['theta']) if pd.notna(row.get('theta')) else 0,
-                'gamma': float(row['gamma']) if pd.notna(row.get('gamma')) else 0,
-                'vega': float(row['vega']) if pd.notna(row.get('vega')) else 0,
-                'premium': mid * 100,  # 每合約 100 股
-            }
+            # 取得期權鏈（指定到期日時直接查該日，否則用最近的到期日）
+            opt_chain = ticker.option_chain(_yf_date(expiration) if expiration else None)
+            frames = {side: opt_chain.puts if side == 'PUT' else opt_chain.calls for side in sides}
+            del opt_chain  # 不需要的另一邊可以先釋放
+            return {side: _pick_option(frames[side], symbol, stock_price, otm_pct, side)
+                    for side in sides}
             
         except Exception as e:
             logger.error(f"yfinance 期權失敗: {e}")
-            return {'error': str(e)}
+            return {side: {'error': str(e)} for side in sides}
 
     def get_option_chain(self, symbol: str, otm_pct: float = 10, 
-                         option_type: str = 'PUT', expiration: str = None) -> dict:
+                         option_type: str = 'PUT', expiration: str = None,
+                         stock_price: Optional[float] = None) -> dict:
         """取得期權鏈 - 用 yfinance"""
         
         # 直接用 yfinance（IB 期權權限有問題）
-        result = self._get_option_chain_yf(symbol, otm_pct, option_type)
+        result = self._get_option_chain_yf(symbol, otm_pct, option_type, stock_price, expiration)
         
         if 'error' not in result:
             return result
@@ -272,22 +575,40 @@ class IBWheel:
         # Fallback 失敗，回傳錯誤
         return result
     
+    def _get_both_sides(self, symbol: str, otm_pct: float = 10,
+                        stock_price: Optional[float] = None) -> dict:
+        """下載一次期權鏈，同時取得 PUT 和 CALL（有快取）"""
+        return self._get_option_sides_yf(symbol, otm_pct, ('PUT', 'CALL'), stock_price)
+    
+    def get_option_chains(self, symbols: list, otm_pct: float = 10,
+                          option_type: str = 'PUT') -> dict:
+        """批次取得期權鏈 - yfinance 並行查詢"""
+        results = _parallel_map(
+            lambda s: self._get_option_chain_yf(s, otm_pct, option_type), symbols)
+        return dict(zip(symbols, results))
+    
     def _get_next_expiration(self, symbol: str) -> Optional[str]:
+        """取得下一個到期日（有快取）"""
+        return _cached(f'expiration:{symbol}', _CHAIN_TTL,
+                       lambda: self._fetch_next_expiration(symbol))
+    
+    def _fetch_next_expiration(self, symbol: str) -> Optional[str]:
         """取得下一個到期日"""
         try:
-            stock = Stock(symbol, 'SMART', 'USD')
-            self.ib.qualifyContracts(stock)
+            stock = self._qualified_stock(symbol)
             chains = self.ib.reqSecDefOptParams(stock.symbol, '', stock.secType, stock.conId)
             
             if not chains:
                 return None
             
             chain = chains[0]
-            today = datetime.now().strftime('%Y%m%d')
-            valid_exps = [e for e in chain.expirations if e >= today]
+            today = int(datetime.now().strftime('%Y%m%d'))
+            exps = np.fromiter((int(e) for e in chain.expirations), dtype=np.int32,
+                               count=len(chain.expirations))
+            valid_exps = exps[exps >= today]
             
-            if valid_exps:
-                return sorted(valid_exps)[0]
+            if valid_exps.size:
+                return str(valid_exps.min())
             return None
         except:
             return None
@@ -296,8 +617,7 @@ class IBWheel:
                          target_strike: float) -> dict:
         """取得單一期權數據"""
         try:
-            stock = Stock(symbol, 'SMART', 'USD')
-            self.ib.qualifyContracts(stock)
+            stock = self._qualified_stock(symbol)
             
             # 取得 chain - 嘗試多個 exchange
             chains = self.ib.reqSecDefOptParams(stock.symbol, '', stock.secType, stock.conId)
@@ -332,18 +652,19 @@ class IBWheel:
             contract = qualified[0]
             ticker = self.ib.reqMktData(contract, '106', False, False)
             
-            for _ in range(30):
-                self.ib.sleep(0.1)
-                if ticker.modelGreeks:
+            # 等到 greeks 到達（最多 3 秒），有更新就立刻醒來
+            deadline = time.monotonic() + 3.0
+            while not ticker.modelGreeks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
                     break
+                self.ib.waitOnUpdate(timeout=remaining)
             
             bid = ticker.bid or 0
             ask = ticker.ask or 0
             last = ticker.last or 0
             
-            greeks = ticker.modelGreeks or type('obj', (object,), {
-                'delta': 0, 'gamma': 0, 'theta': 0, 'vega': 0
-            })()
+            greeks = ticker.modelGreeks or _ZERO_GREEKS
             
             self.ib.cancelMktData(contract)
             
@@ -378,16 +699,7 @@ class IBWheel:
             account_id = self.ib.managedAccounts()[0]
             values = self.ib.accountSummary(account_id)
             
-            account = {}
-            for v in values:
-                if v.tag == 'NetLiquidation':
-                    account['net_liquidation'] = float(v.value)
-                elif v.tag == 'TotalCashValue':
-                    account['cash'] = float(v.value)
-                elif v.tag == 'ExcessLiquidity':
-                    account['excess_liquidity'] = float(v.value)
-                elif v.tag == 'FullInitMarginReq':
-                    account['margin'] = float(v.value)
+            account = {_ACCT_MAP[v.tag]: float(v.value) for v in values if v.tag in _ACCT_MAP}
             
             positions = []
             for pos in self.ib.portfolio():
@@ -411,20 +723,36 @@ class IBWheel:
     
     def wheel_recommendation(self, symbol: str, cash_available: float = None) -> dict:
         """Wheel Strategy 推薦"""
-        # 取得股價
-        stock_price = self.get_stock_price(symbol)
-        if not stock_price:
-            return {'error': f'無法取得 {symbol} 股價'}
+        return self.wheel_recommendations([symbol], cash_available)[symbol]
+    
+    def wheel_recommendations(self, symbols: list, cash_available: float = None) -> dict:
+        """多檔 Wheel Strategy 推薦 - IB 查詢在本 thread，yfinance 期權鏈並行查詢"""
+        # 取得股價（IB 連線綁定在 event loop 上，不能丟到其他 thread）
+        prices = self.get_stock_prices(symbols)
         
-        # 取得持倉
+        # 取得持倉（多檔共用一次查詢）
         portfolio = self.get_portfolio()
-        has_stock = False
-        if 'positions' in portfolio:
-            for pos in portfolio['positions']:
-                if pos.get('symbol') == symbol and pos.get('shares', 0) > 0:
-                    has_stock = True
-                    break
+        held = {pos.get('symbol') for pos in portfolio.get('positions', [])
+                if pos.get('shares', 0) > 0}
+        
+        # PUT / CALL 共用同一份期權鏈，各檔並行下載
+        priced = [s for s in symbols if prices.get(s)]
+        chains = _parallel_map(
+            lambda s: self._get_both_sides(s, otm_pct=10, stock_price=prices[s]), priced)
+        sides_by_symbol = dict(zip(priced, chains))
         
+        results = {}
+        for symbol in symbols:
+            if symbol not in sides_by_symbol:
+                results[symbol] = {'error': f'無法取得 {symbol} 股價'}
+            else:
+                results[symbol] = self._recommend(symbol, prices[symbol], symbol in held,
+                                                  sides_by_symbol[symbol], cash_available)
+        return results
+    
+    def _recommend(self, symbol: str, stock_price: float, has_stock: bool,
+                   sides: dict, cash_available: float = None) -> dict:
+        """根據持股狀態選 CSP 或 CC"""
         # 沒有持股 → 推薦 CSP
         if not has_stock:
             # 計算可以賣幾個 contract
@@ -434,7 +762,7 @@ class IBWheel:
                 max_contracts = 1
             
             # 取得 PUT 數據 (10% OTM)
-            put_data = self.get_option_chain(symbol, otm_pct=10, option_type='PUT')
+            put_data = sides['PUT']
             
             if 'error' in put_data:
                 return put_data
@@ -461,7 +789,7 @@ class IBWheel:
         # 有持股 → 推薦 CC
         else:
             # 取得 CALL 數據 (10% OTM)
-            call_data = self.get_option_chain(symbol, otm_pct=10, option_type='CALL')
+            call_data = sides['CALL']
             
             if 'error' in call_data:
                 return call_data
@@ -484,27 +812,64 @@ class IBWheel:
 
 # === OpenClaw Tool Functions ===
 
-def get_price(symbol: str) -> str:
-    """查詢股價"""
-    wheel = IBWheel()
-    price = wheel.get_stock_price(symbol.upper())
-    wheel.disconnect()
+# 共享的 IBWheel - 所有 tool 呼叫重複使用同一個連線
+_WHEEL = None
+_WHEEL_LOCK = threading.Lock()
+
+
+def _wheel_singleton() -> IBWheel:
+    """取得共享的 IBWheel（第一次使用時才建立）"""
+    global _WHEEL
+    with _WHEEL_LOCK:
+        if _WHEEL is None:
+            _WHEEL = IBWheel()
+        return _WHEEL
+
+
+@atexit.register
+def _shutdown():
+    """程式結束時斷開共享連線"""
+    if _ib_instance and _ib_instance.isConnected():
+        _ib_instance.disconnect()
+
+
+def _to_symbols(symbol) -> list:
+    """單一代碼或代碼 list 統一轉成大寫 list（去除重複，保留順序）"""
+    if isinstance(symbol, str):
+        return [symbol.upper()]
+    return list(dict.fromkeys(s.upper() for s in symbol))
+
+
+def get_price(symbol) -> str:
+    """查詢股價（可傳入多個代碼）"""
+    symbols = _to_symbols(symbol)
+    wheel = _wheel_singleton()
+    prices = wheel.get_stock_prices(symbols)
     
-    if price:
-        return f"**{symbol.upper()}** 現在價格: **${price:.2f}**"
-    return f"無法取得 {symbol} 股價"
+    lines = []
+    for s in symbols:
+        if prices.get(s):
+            lines.append(f"**{s}** 現在價格: **${prices[s]:.2f}**")
+        else:
+            lines.append(f"無法取得 {s} 股價")
+    return '\n'.join(lines)
 
 
-def get_options(symbol: str, otm_pct: float = 10, option_type: str = 'PUT') -> str:
-    """查詢期權鏈"""
-    wheel = IBWheel()
-    data = wheel.get_option_chain(symbol.upper(), otm_pct, option_type)
-    wheel.disconnect()
+def get_options(symbol, otm_pct: float = 10, option_type: str = 'PUT') -> str:
+    """查詢期權鏈（可傳入多個代碼）"""
+    symbols = _to_symbols(symbol)
+    wheel = _wheel_singleton()
+    chains = wheel.get_option_chains(symbols, otm_pct, option_type)
     
+    return '\n\n'.join(_format_options(s, chains[s], otm_pct, option_type) for s in symbols)
+
+
+def _format_options(symbol: str, data: dict, otm_pct: float, option_type: str) -> str:
+    """格式化期權數據"""
     if 'error' in data:
-        return f"錯誤: {data['error']}"
+        return f"**{symbol}** 錯誤: {data['error']}"
     
-    return (f"**{symbol.upper()}** 期權數據 (OTM {otm_pct}% {option_type}):\n"
+    return (f"**{symbol}** 期權數據 (OTM {otm_pct}% {option_type}):\n"
             f"• 股價: ${data['stock_price']:.2f}\n"
             f"• Strike: ${data['strike']:.2f}\n"
             f"• Bid: ${data['bid']:.2f} | Ask: ${data['ask']:.2f}\n"
@@ -513,25 +878,29 @@ def get_options(symbol: str, otm_pct: float = 10, option_type: str = 'PUT') -> s
             f"• 權利金: ${data['premium']:.2f}/合約")
 
 
-def wheel_recommend(symbol: str) -> str:
-    """Wheel Strategy 推薦"""
-    wheel = IBWheel()
-    data = wheel.wheel_recommendation(symbol.upper())
-    wheel.disconnect()
+def wheel_recommend(symbol) -> str:
+    """Wheel Strategy 推薦（可傳入多個代碼）"""
+    symbols = _to_symbols(symbol)
+    wheel = _wheel_singleton()
+    results = wheel.wheel_recommendations(symbols)
     
+    return '\n\n'.join(_format_wheel(s, results[s]) for s in symbols)
+
+
+def _format_wheel(symbol: str, data: dict) -> str:
+    """格式化 Wheel 建議"""
     if 'error' in data:
-        return f"錯誤: {data['error']}"
+        return f"**{symbol}** 錯誤: {data['error']}"
     
-    return (f"**{symbol.upper()}** Wheel 建議:\n"
+    return (f"**{symbol}** Wheel 建議:\n"
             f"• 動作: **{data['action']}**\n"
             f"• {data['description']}")
 
 
 def portfolio_status() -> str:
     """查看持倉"""
-    wheel = IBWheel()
+    wheel = _wheel_singleton()
     data = wheel.get_portfolio()
-    wheel.disconnect()
     
     if 'error' in data:
         return f"錯誤: {data['error']}"
@@ -556,33 +925,60 @@ def portfolio_status() -> str:
 
 
 # === Main handler for OpenClaw ===
+
+# 股票代碼格式（例如 NVDA、BRK.B、BF-B）
+_TICKER_RE = re.compile(r'[A-Z][A-Z0-9.\-]{0,9}')
+
+# 期權類型參數，不當作股票代碼
+_OPTION_TYPE_ARGS = ('CALL', 'PUT', 'C', 'P')
+
+
+def _is_ticker(arg: str) -> bool:
+    """參數看起來是不是股票代碼"""
+    u = arg.upper()
+    return arg.isascii() and u not in _OPTION_TYPE_ARGS and bool(_TICKER_RE.fullmatch(u))
+
+
+def _cli_symbols(args: list) -> list:
+    """從參數中挑出股票代碼 - 第一個參數一定是代碼，其他的要像代碼才算（去除重複）"""
+    symbols = [args[0].upper()] + [a.upper() for a in args[1:] if _is_ticker(a)]
+    return list(dict.fromkeys(symbols))
+
+
+def _parse_and_get_options(args: list) -> str:
+    """解析期權參數（OTM %、CALL/PUT、其他代碼）並查詢"""
+    otm = 10
+    opt_type = 'PUT'
+    
+    for a in args[1:]:
+        u = a.upper()
+        if a.isdigit():
+            otm = int(a)
+        elif u in _OPTION_TYPE_ARGS:
+            opt_type = 'CALL' if u[0] == 'C' else 'PUT'
+    
+    return get_options(_cli_symbols(args), otm, opt_type)
+
+
+# 命令關鍵字 -> handler(args)，依序比對
+_DISPATCH = (
+    ({'price', '股價'}, lambda a: get_price(_cli_symbols(a))),
+    ({'option', '期權'}, _parse_and_get_options),
+    ({'wheel'}, lambda a: wheel_recommend(_cli_symbols(a))),
+    ({'portfolio', '持倉', '帳戶'}, lambda a: portfolio_status()),
+)
+
+
 def handle_wheel_command(command: str, args: list) -> str:
     """處理 Wheel 命令"""
     if not args:
         return "請提供股票代碼，例如: wheel NVDA"
     
-    symbol = args[0].upper()
+    for keywords, handler in _DISPATCH:
+        if any(k in command for k in keywords):
+            return handler(args)
     
-    if 'price' in command or '股價' in command:
-        return get_price(symbol)
-    elif 'option' in command or '期權' in command:
-        otm = 10
-        opt_type = 'PUT'
-        
-        # 解析參數
-        for a in args[1:]:
-            if a.isdigit():
-                otm = int(a)
-            elif a.upper() in ['CALL', 'PUT', 'C', 'P']:
-                opt_type = a.upper() if a.upper() in ['CALL', 'PUT'] else ('CALL' if a.upper() == 'C' else 'PUT')
-        
-        return get_options(symbol, otm, opt_type)
-    elif 'wheel' in command:
-        return wheel_recommend(symbol)
-    elif 'portfolio' in command or '持倉' in command or '帳戶' in command:
-        return portfolio_status()
-    else:
-        return f"未知命令: {command}。可用: price, options, wheel, portfolio"
+    return f"未知命令: {command}。可用: price, options, wheel, portfolio"
 
 
 if __name__ == '__main__':